@@ -1,16 +1,60 @@
 import asyncio
 import logging
+import os
+import signal
+import time
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 
 from src.config import configs
+from src.config.config import TelegramBot
 from src.handlers import user_handlers
+from src.handlers.middlewares import (
+    DialogManagerMiddleware, InFlightMiddleware
+)
+from src.models import DictDialogStorage, TelegramDialogManager
+from src.services.profiling import dump_profiles, watchdog
+from src.services.scheduler import scheduler
+from src.services.tokenizer import get_encoder
 
 
 logger = logging.getLogger(__name__)
 
 
+def get_memory_usage() -> int | None:
+    """Returns resident memory of the process in KiB (None if unknown)."""
+    try:
+        with open("/proc/self/statm") as file:
+            pages = int(file.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def get_snapshot_path(namespace: str) -> str:
+    """Returns the chats snapshot file path of the storage namespace."""
+    root, extension = os.path.splitext(configs.CHATS_SNAPSHOT_PATH)
+    return f"{root}.{namespace}{extension}"
+
+
+def setup_bot(tg_bot: TelegramBot) -> tuple[Bot, TelegramDialogManager]:
+    """Creates the bot and its dialog manager with restored chats."""
+    bot: Bot = Bot(
+        token=tg_bot.token,
+        default=DefaultBotProperties(parse_mode="HTML"),
+    )
+    # Warm up the tokenizer, it's shared by bots with the same model.
+    get_encoder(configs.chat_models[tg_bot.model_name].chat_model.model)
+
+    dialog_storage = DictDialogStorage(namespace=str(tg_bot.id))
+    restored = dialog_storage.load(get_snapshot_path(dialog_storage.namespace))
+    for chat in dialog_storage.chats.values():
+        chat.bind_config(tg_bot.model_name)
+    logger.info("Restored %d chats of bot %d.", restored, tg_bot.id)
+    return bot, TelegramDialogManager(dialog_storage, tg_bot.model_name)
+
+
 async def main():
     if configs.tg_bot.debug_mode:
         logging_level = logging.DEBUG
@@ -22,18 +66,63 @@ async def main():
         "[%(asctime)s] - %(name)s - %(message)s",
     )
 
-    logger.info("Starting bot...")
+    logger.info("Starting %d bots...", len(configs.bots))
+
+    bots: list[Bot] = []
+    dialog_managers: dict[int, TelegramDialogManager] = {}
+    for tg_bot in configs.bots:
+        start, memory_before = time.perf_counter(), get_memory_usage()
+        bot, dialog_managers[tg_bot.id] = setup_bot(tg_bot)
+        bots.append(bot)
+        # Open the bot HTTP session, so its memory is counted too.
+        await bot.delete_webhook(drop_pending_updates=False)
+        await bot.me()
+        memory_after = get_memory_usage()
+        logger.info(
+            "Bot %d (%s) is ready in %.3fs, memory +%s KiB.",
+            tg_bot.id,
+            tg_bot.model_name,
+            time.perf_counter() - start,
+            "?" if memory_before is None else memory_after - memory_before,
+        )
 
-    bot: Bot = Bot(
-        token=configs.tg_bot.token,
-        default=DefaultBotProperties(parse_mode="HTML"),
-    )
     dp: Dispatcher = Dispatcher()
+    in_flight = InFlightMiddleware()
 
+    dp.update.outer_middleware(in_flight)
+    dp.update.outer_middleware(DialogManagerMiddleware(dialog_managers))
     dp.include_router(user_handlers.router)
 
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    if configs.profiling.enabled:
+        logger.info("Profiling is enabled, send SIGUSR1 to dump profiles.")
+        watchdog.start()
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGUSR1, dump_profiles
+        )
+
+    if configs.scheduler.stats_interval:
+        scheduler.start_logging_stats(configs.scheduler.stats_interval)
+
+    try:
+        # Polling stops on SIGTERM/SIGINT; sessions are kept open to let
+        # in-flight handlers send their answers.
+        await dp.start_polling(*bots, close_bot_session=False)
+    finally:
+        if unfinished := await in_flight.drain(configs.SHUTDOWN_TIMEOUT):
+            logger.warning("%d updates weren't handled in time.", unfinished)
+        for dialog_manager in dialog_managers.values():
+            dialog_storage = dialog_manager.dialog_storage
+            saved = dialog_storage.dump(
+                get_snapshot_path(dialog_storage.namespace)
+            )
+            logger.info(
+                "Saved %d chats of bot %s.", saved, dialog_storage.namespace
+            )
+        for bot in bots:
+            await bot.session.close()
+        if configs.profiling.enabled:
+            watchdog.stop()
+            dump_profiles()
 
 
 if __name__ == "__main__":
@@ -8,7 +8,7 @@ from typing import Any, Literal, Optional
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
 
-from .helpers import get_env_variable
+from .helpers import get_env_variable, parse_bot_tokens
 
 
 MAX_TELEGRAM_MESSAGE_LEN: int = 4095
@@ -19,6 +19,48 @@ logger: logging.Logger = logging.getLogger(__name__)
 class TelegramBot:
     token: str
     debug_mode: bool = False
+    model_name: str = "default"
+    """Name of the bot's model configuration in the models file."""
+
+    @property
+    def id(self) -> int:
+        """Telegram bot ID (the first part of the token)."""
+        return int(self.token.split(":")[0])
+
+
+@dataclass
+class SchedulerLimits:
+    """Limits of the OpenAI requests scheduler.
+
+    Attributes:
+        text_concurrency: Max simultaneous chat completion requests.
+        audio_concurrency: Max simultaneous speech requests (TTS and STT).
+        max_user_requests: Max messages of one user being answered at once.
+        stats_interval: Seconds between logging the queues statistics,
+            0 to disable.
+    """
+    text_concurrency: int = 8
+    audio_concurrency: int = 4
+    max_user_requests: int = 2
+    stats_interval: float = 300
+
+
+@dataclass
+class Profiling:
+    """Configuration of the opt-in requests profiling.
+
+    Attributes:
+        enabled: Record requests stages timelines and watch the event loop.
+        block_threshold: Seconds of the event loop being blocked to report.
+        slowest_num: Number of the slowest requests to dump.
+        buffer_size: Number of the last requests timelines to keep.
+        dump_directory: Directory to dump profiles to.
+    """
+    enabled: bool = False
+    block_threshold: float = 0.1
+    slowest_num: int = 10
+    buffer_size: int = 1000
+    dump_directory: str = "profiles"
 
 
 class ModelConfig(BaseModel):
@@ -90,12 +132,15 @@ class ChatbotConfig(BaseModel):
             responses. Should be concise, clear, and not exceed 250 characters.
             Example: "You are a helpful assistant."
         max_context_len: Max context window in tokens.
+        stream: Send an answer by parts while it's being generated.
+            Ignored in the voice mode.
 
     """
     description: str = Field(
         default="You are a helpful assistant.", max_length=250
     )
     max_context_len: int = Field(3500, gt=0, lt=16385)
+    stream: bool = False
 
 
 class ChatModel(BaseModel):
@@ -160,9 +205,14 @@ class ChatModel(BaseModel):
 @dataclass
 class Config:
     tg_bot: TelegramBot
-    chat_model: ChatModel
+    bots: list[TelegramBot]
+    chat_models: dict[str, ChatModel]
+    scheduler: SchedulerLimits
+    profiling: Profiling
     VOICES_DIRECTORY: str
     OPENAI_TOKEN: str
+    CHATS_SNAPSHOT_PATH: str
+    SHUTDOWN_TIMEOUT: float
 
 
 def load_config() -> Config:
@@ -172,29 +222,90 @@ def load_config() -> Config:
     # Common configuration
     BASE_DIR: str = Path(__file__).resolve().parent.parent.parent
 
-    # Telegram bot configuration
-    tg_bot: TelegramBot = TelegramBot(
-        token=get_env_variable("BOT_TOKEN"),
-        debug_mode=get_env_variable("DEBUG") == "1",
-    )
+    # Telegram bots configuration
+    debug_mode: bool = get_env_variable("DEBUG") == "1"
+    if BOT_TOKENS := get_env_variable("BOT_TOKENS", default=""):
+        bot_tokens = parse_bot_tokens(BOT_TOKENS)
+    else:
+        bot_tokens = [(
+            get_env_variable("MODEL_CONFIG_NAME"),
+            get_env_variable("BOT_TOKEN"),
+        )]
+    bots: list[TelegramBot] = [
+        TelegramBot(token=token, debug_mode=debug_mode, model_name=model_name)
+        for model_name, token in bot_tokens
+    ]
+    tg_bot: TelegramBot = bots[0]
 
     # OpenAI model configuration
     MODEL_CONFIG_PATH = os.path.join(
         BASE_DIR, (get_env_variable("MODEL_CONFIG_PATH"))
     )
-    MODEL_CONFIG_NAME = get_env_variable("MODEL_CONFIG_NAME")
-    chat_model: ChatModel = ChatModel.load_from_yaml_file(
-        MODEL_CONFIG_PATH, MODEL_CONFIG_NAME
+    chat_models: dict[str, ChatModel] = {}
+    for bot in bots:
+        if bot.model_name not in chat_models:
+            chat_models[bot.model_name] = ChatModel.load_from_yaml_file(
+                MODEL_CONFIG_PATH, bot.model_name
+            )
+            logger.info(
+                "The chat model '%s' loaded: %s",
+                bot.model_name, chat_models[bot.model_name],
+            )
+
+    # OpenAI requests scheduler configuration
+    scheduler: SchedulerLimits = SchedulerLimits(
+        text_concurrency=get_env_variable(
+            "SCHEDULER_TEXT_CONCURRENCY", cast_to=int, default=8
+        ),
+        audio_concurrency=get_env_variable(
+            "SCHEDULER_AUDIO_CONCURRENCY", cast_to=int, default=4
+        ),
+        max_user_requests=get_env_variable(
+            "SCHEDULER_MAX_USER_REQUESTS", cast_to=int, default=2
+        ),
+        stats_interval=get_env_variable(
+            "SCHEDULER_STATS_INTERVAL", cast_to=float, default=300
+        ),
+    )
+
+    # Profiling configuration
+    profiling: Profiling = Profiling(
+        enabled=get_env_variable("PROFILING", default="0") == "1",
+        block_threshold=get_env_variable(
+            "PROFILING_BLOCK_THRESHOLD", cast_to=float, default=0.1
+        ),
+        slowest_num=get_env_variable(
+            "PROFILING_SLOWEST_NUM", cast_to=int, default=10
+        ),
+        buffer_size=get_env_variable(
+            "PROFILING_BUFFER_SIZE", cast_to=int, default=1000
+        ),
+        dump_directory=os.path.join(BASE_DIR, "data", "profiles"),
     )
-    logger.info("The chat model loaded: %s", chat_model)
 
     VOICES_DIRECTORY: str = os.path.join(BASE_DIR, "temp")
     if not os.path.isdir(VOICES_DIRECTORY):
         os.mkdir(VOICES_DIRECTORY)
 
+    # Graceful shutdown configuration
+    CHATS_SNAPSHOT_PATH: str = os.path.join(
+        BASE_DIR,
+        get_env_variable(
+            "CHATS_SNAPSHOT_PATH", default=os.path.join("data", "chats.json")
+        ),
+    )
+    SHUTDOWN_TIMEOUT: float = get_env_variable(
+        "SHUTDOWN_TIMEOUT", cast_to=float, default=25.0
+    )
+
     return Config(
         tg_bot=tg_bot,
-        chat_model=chat_model,
+        bots=bots,
+        chat_models=chat_models,
+        scheduler=scheduler,
+        profiling=profiling,
         VOICES_DIRECTORY=VOICES_DIRECTORY,
         OPENAI_TOKEN=get_env_variable("OPENAI_TOKEN"),
+        CHATS_SNAPSHOT_PATH=CHATS_SNAPSHOT_PATH,
+        SHUTDOWN_TIMEOUT=SHUTDOWN_TIMEOUT,
     )
@@ -1,14 +1,20 @@
 import os
+from typing import Any
 
 from src.errors.errors import ImproperlyConfigured
 
 
-def get_env_variable(var_name: str, cast_to=str) -> str:
+_MISSING: Any = object()
+
+
+def get_env_variable(var_name: str, cast_to=str, default=_MISSING) -> str:
     """Get an environment variable or raise an exception.
 
     Args:
         var_name: a name of a environment variable.
         cast_to: a type for variable casting.
+        default: a value to return if the variable is not set. If omitted,
+            the variable is required.
 
     Returns:
         A value of the environment variable.
@@ -19,6 +25,38 @@ def get_env_variable(var_name: str, cast_to=str) -> str:
     try:
         return cast_to(os.environ[var_name])
     except KeyError:
+        if default is not _MISSING:
+            return default
         raise ImproperlyConfigured(var_name)
     except ValueError:
         raise ValueError("Bad environment variable casting.")
+
+
+def parse_bot_tokens(value: str) -> list[tuple[str, str]]:
+    """Parses bot tokens mapped to model configuration names.
+
+    Args:
+        value: Comma separated `model_name=token` pairs, e.g.
+            "default=123:AAA,pirate=456:BBB".
+
+    Returns:
+        A list of (model configuration name, bot token) pairs.
+
+    Raises:
+        ValueError: if the value has a bad format or a bot is listed twice.
+    """
+    bot_tokens = []
+    bot_ids = set()
+    for pair in value.split(","):
+        model_name, _, token = pair.strip().partition("=")
+        if not model_name or not token:
+            raise ValueError(
+                "Bad bot tokens format, expected `model_name=token` pairs."
+            )
+        # A token starts with the bot ID, chats of a bot are kept by it.
+        bot_id = token.strip().partition(":")[0]
+        if bot_id in bot_ids:
+            raise ValueError(f"Bot {bot_id} token is listed twice.")
+        bot_ids.add(bot_id)
+        bot_tokens.append((model_name.strip(), token.strip()))
+    return bot_tokens
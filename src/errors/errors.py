@@ -13,3 +13,7 @@ class ChatDoesNotExist(Exception):
 
 class EmptyTrancriptionResult(Exception):
     """A trancription result is an empty string."""
+
+
+class TooManyRequests(Exception):
+    """A user has too many outstanding requests to OpenAI."""
@@ -4,6 +4,7 @@ from aiogram.types import Message
 
 from src.config import configs
 from src.config.config import MAX_TELEGRAM_MESSAGE_LEN
+from src.services.profiling import recorder
 
 
 def process_error(error_message: str) -> str:
@@ -37,3 +38,15 @@ def debug_handler_reply(handler):
                 await message.reply(text=error_message, parse_mode="Markdown")
             raise
     return wrapper
+
+
+def record_handler_timeline(handler):
+    """Records stages timeline of the handler if profiling is enabled."""
+    if not configs.profiling.enabled:
+        return handler
+
+    @functools.wraps(handler)
+    async def wrapper(message: Message, *args, **kwargs):
+        with recorder.request(handler.__name__, message.from_user.id):
+            return await handler(message, *args, **kwargs)
+    return wrapper
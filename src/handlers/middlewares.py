@@ -0,0 +1,72 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from src.models import TelegramDialogManager
+
+
+Handler = Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]]
+logger = logging.getLogger(__name__)
+
+
+class InFlightMiddleware(BaseMiddleware):
+    """Tracks updates being handled to let them finish on shutdown.
+
+    Register it as an outer update middleware, so every handled update
+    is tracked from the very beginning.
+    """
+
+    def __init__(self):
+        self.tasks: set[asyncio.Task] = set()
+
+    async def __call__(
+            self,
+            handler: Handler,
+            event: TelegramObject,
+            data: dict[str, Any],
+    ) -> Any:
+        task = asyncio.current_task()
+        self.tasks.add(task)
+        try:
+            return await handler(event, data)
+        finally:
+            self.tasks.discard(task)
+
+    async def drain(self, timeout: float) -> int:
+        """Waits for the tracked updates to be handled.
+
+        Args:
+            timeout: Max seconds to wait.
+
+        Returns:
+            The number of updates that weren't handled in time.
+        """
+        if not self.tasks:
+            return 0
+        logger.info("Waiting for %d in-flight updates...", len(self.tasks))
+        _, pending = await asyncio.wait(set(self.tasks), timeout=timeout)
+        return len(pending)
+
+
+class DialogManagerMiddleware(BaseMiddleware):
+    """Passes the dialog manager of the bot to handlers.
+
+    Handlers get it as the `dialog_manager` argument.
+    """
+
+    def __init__(self, dialog_managers: dict[int, TelegramDialogManager]):
+        self.dialog_managers: dict[int, TelegramDialogManager] = (
+            dialog_managers
+        )
+
+    async def __call__(
+            self,
+            handler: Handler,
+            event: TelegramObject,
+            data: dict[str, Any],
+    ) -> Any:
+        data["dialog_manager"] = self.dialog_managers[data["bot"].id]
+        return await handler(event, data)
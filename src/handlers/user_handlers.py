@@ -1,34 +1,50 @@
 from aiogram import Bot, F, Router
 from aiogram.types import Message
 
-from src.errors.errors import EmptyTrancriptionResult
-from src.handlers.helpers import debug_handler_reply
-from src.models import TelegramDialogManager, DictDialogStorage
+from src.errors.errors import EmptyTrancriptionResult, TooManyRequests
+from src.handlers.helpers import debug_handler_reply, record_handler_timeline
+from src.models import TelegramDialogManager
 from src.services.messages import SystemMessage, get_message
+from src.services.scheduler import scheduler
 
 
 router = Router()
-dialog_manager = TelegramDialogManager(DictDialogStorage())
 
 
 @router.message(F.content_type == "text")
+@record_handler_timeline
 @debug_handler_reply
-async def process_text_message(message: Message):
+async def process_text_message(
+        message: Message, dialog_manager: TelegramDialogManager
+):
     """Gets text update and sends answer of an Open AI chatbot model."""
     if not message.text:
         answer = get_message(SystemMessage.NO_INPUT)
         await message.reply(text=answer)
     else:
-        await dialog_manager.reply_on_text(message)
+        try:
+            with scheduler.admit(message.from_user.id):
+                await dialog_manager.reply_on_text(message)
+        except TooManyRequests:
+            answer = get_message(SystemMessage.TOO_MANY_REQUESTS)
+            await message.reply(text=answer)
 
 
 @router.message(F.content_type == "voice")
+@record_handler_timeline
 @debug_handler_reply
-async def process_voice_message(message: Message, bot: Bot):
+async def process_voice_message(
+        message: Message, bot: Bot, dialog_manager: TelegramDialogManager
+):
     """Gets audio update and sends answer of an Open AI chatbot model."""
     try:
-        await dialog_manager.reply_on_voice(message, bot)
+        with scheduler.admit(message.from_user.id):
+            await dialog_manager.reply_on_voice(message, bot)
 
     except EmptyTrancriptionResult:
         answer = get_message(SystemMessage.UNINTELLIGIBLE_VOICE_INPUT)
         await message.reply(text=answer)
+
+    except TooManyRequests:
+        answer = get_message(SystemMessage.TOO_MANY_REQUESTS)
+        await message.reply(text=answer)
@@ -1,7 +1,7 @@
 from abc import ABC, abstractmethod
 from enum import Enum
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 
 
 class Role(str, Enum):
@@ -13,6 +13,8 @@ class Role(str, Enum):
 class Message(BaseModel):
     content: str
     role: Role
+    # Cached number of tokens, it isn't sent to OpenAI.
+    _tokens_num: int | None = PrivateAttr(default=None)
 
 
 class BaseChat(BaseModel):
@@ -1,21 +1,33 @@
+import asyncio
 import logging
+import json
+import os
 import uuid
+from typing import AsyncIterator
 
 from aiogram import Bot
 from aiogram.types import BufferedInputFile, Message as TgMessage
-import tiktoken
+from pydantic import ValidationError
 
-from src.config import configs
-from src.config.config import MAX_TELEGRAM_MESSAGE_LEN
+from src.config import ChatModel, configs
 from src.errors.errors import ChatDoesNotExist, EmptyTrancriptionResult
 from src.services.audio import save_voice_as_mp3
-from src.services.openai_api import complete, text_to_speech, speech_to_text
+from src.services.delivery import send_chunks, split_stream, split_text
+from src.services.openai_api import (
+    complete, complete_stream, text_to_speech, speech_to_text
+)
+from src.services.profiling import recorder
+from src.services.scheduler import (
+    AUDIO_SECONDS_PER_COST_UNIT, Lane, scheduler
+)
+from src.services.tokenizer import token_counter
 
 from .base import BaseChat, DialogStorage, Role, Message
 
 
-chat_model = configs.chat_model
-encoder = tiktoken.encoding_for_model(chat_model.chat_model.model)
+SNAPSHOT_VERSION: int = 1
+"""Version of the chats snapshot format, bump it on incompatible changes."""
+
 logger = logging.getLogger(__name__)
 
 
@@ -24,34 +36,101 @@ class Chat(BaseChat):
 
     Chat manages the messages history and makes request to OpenAI.
 
+    Attrs:
+        config_name: Name of the chat model configuration of the bot.
+
     """
 
-    max_context_window: int = chat_model.chatbot.max_context_len
-    """Maxinum context window in tokens.
+    config_name: str = configs.tg_bot.model_name
 
-    Old messages that exceed this windows will be removed.
-    """
+    @property
+    def chat_model(self) -> ChatModel:
+        """Chat model configuration of the bot."""
+        return configs.chat_models[self.config_name]
+
+    @property
+    def max_context_window(self) -> int:
+        """Maxinum context window in tokens.
 
-    def add_message(self, text: str, role: Role = Role.USER):
+        Old messages that exceed this windows will be removed.
+        """
+        return self.chat_model.chatbot.max_context_len
+
+    async def add_message(self, text: str, role: Role = Role.USER):
         """Add a message to the chat.
 
+        Tokens of new messages are counted in background by the shared
+        `token_counter`, so long texts don't block the event loop. The
+        context is trimmed once all messages are counted.
+
         Args:
             text: The text of the message.
             role: OpenAI chat role.
         """
-        self.messages.append(Message(content=text, role=role))
-        self._trim_context()
+        with recorder.stage("add_message"):
+            self.messages.append(Message(content=text, role=role))
+            with recorder.stage("count_tokens"):
+                # Messages may be added while the tokens are being counted.
+                while any(m._tokens_num is None for m in self.messages):
+                    await self._count_tokens()
+            with recorder.stage("trim_context"):
+                self._trim_context()
 
     def model_post_init(self, __context) -> None:
-        """Initializes the context with the chatbot description."""
-        self.add_message(chat_model.chatbot.description, Role.SYSTEM)
+        """Initializes the context with the chatbot description.
 
-    @classmethod
-    def _get_message_tokens_num(cls, message: Message) -> int:
-        """Returns the number of tokens in a message."""
-        message_as_str = f"{message.content}{message.role}"
-        # Every reply is primed with <|start|>role<|message|>, so add 3 tokens.
-        return len(encoder.encode(message_as_str)) + 3
+        Tokens of the description are counted with the next message. Chats
+        restored with their messages already have the description.
+        """
+        if self.messages:
+            return
+        system_message = Message(
+            content=self.chat_model.chatbot.description, role=Role.SYSTEM
+        )
+        self.messages.append(system_message)
+
+    def bind_config(self, config_name: str) -> None:
+        """Binds the chat to a chat model configuration.
+
+        Restored chats must be bound to the configuration of the bot owning
+        them. The chatbot description is replaced if it has changed.
+
+        Args:
+            config_name: Name of the chat model configuration.
+        """
+        self.config_name = config_name
+        description = self.chat_model.chatbot.description
+        if self.messages and self.messages[0].role == Role.SYSTEM:
+            if self.messages[0].content == description:
+                return
+            self.messages.pop(0)
+        self.messages.insert(
+            0, Message(content=description, role=Role.SYSTEM)
+        )
+
+    @staticmethod
+    def _get_message_as_str(message: Message) -> str:
+        """Returns the message text which tokens are counted."""
+        return f"{message.content}{message.role}"
+
+    async def _count_tokens(self) -> None:
+        """Counts tokens of messages which aren't counted yet."""
+        messages = [m for m in self.messages if m._tokens_num is None]
+        tokens_nums = await asyncio.gather(*(
+            token_counter.count(
+                self._get_message_as_str(message),
+                self.chat_model.chat_model.model,
+            )
+            for message in messages
+        ))
+        for message, tokens_num in zip(messages, tokens_nums):
+            # Every reply is primed with <|start|>role<|message|>, so add 3.
+            message._tokens_num = tokens_num + 3
+
+    @staticmethod
+    def _get_message_tokens_num(message: Message) -> int:
+        """Returns the number of tokens in a message (0 if not counted)."""
+        return message._tokens_num or 0
 
     def _trim_context(self):
         """Deletes messages if tokens sum exedess `max_context_window`.
@@ -84,8 +163,10 @@ class Chat(BaseChat):
         Returns:
             A string response from the model.
         """
-        answer = await complete(self.messages, chat_model)
-        self.add_message(answer, Role.ASSISTANT)
+        async with scheduler.slot(self.user_id, Lane.TEXT):
+            with recorder.stage("complete"):
+                answer = await complete(self.messages, self.chat_model)
+        await self.add_message(answer, Role.ASSISTANT)
         return answer
 
     async def get_answer(self, text: str) -> str:
@@ -100,18 +181,43 @@ class Chat(BaseChat):
         Returns:
             OpenAI chat model answer.
         """
-        self.add_message(text, Role.USER)
+        await self.add_message(text, Role.USER)
         answer = await self._generate_bot_answer()
         logger.debug("Chat state: %s", self)
         return answer
 
+    async def get_answer_stream(self, text: str) -> AsyncIterator[str]:
+        """Requests OpenAI for an answer and yields it by parts.
+
+        The answer is added to the `messages` once it's fully generated.
+
+        Args:
+            text: User message text to answer.
+
+        Yields:
+            Parts of OpenAI chat model answer.
+        """
+        await self.add_message(text, Role.USER)
+        parts: list[str] = []
+        async with scheduler.slot(self.user_id, Lane.TEXT):
+            with recorder.stage("complete"):
+                async for part in complete_stream(
+                        self.messages, self.chat_model
+                ):
+                    parts.append(part)
+                    yield part
+        await self.add_message("".join(parts).strip(), Role.ASSISTANT)
+        logger.debug("Chat state: %s", self)
+
     async def get_audio_answer(self, text: str) -> bytes:
         """Requests OpenAI for an answer and returns it as audio bytes."""
         answer = await self.get_answer(text)
-        return await text_to_speech(answer, chat_model)
+        async with scheduler.slot(self.user_id, Lane.AUDIO):
+            with recorder.stage("text_to_speech"):
+                return await text_to_speech(answer, self.chat_model)
 
     def __len__(self) -> int:
-        """Chat length in tokens."""
+        """Chat length in counted tokens."""
         if not self.messages:
             return 0
 
@@ -122,9 +228,16 @@ class Chat(BaseChat):
 
 
 class DictDialogStorage(DialogStorage):
-    """Dialog Storage that stores context in Python dict."""
+    """Dialog Storage that stores context in Python dict.
+
+    Attrs:
+        namespace: Storage namespace, e.g. a bot ID, to keep chats of
+            different bots apart.
+    """
 
-    chats: dict[tuple[int, int], Chat] = dict()
+    def __init__(self, namespace: str = "default"):
+        self.namespace: str = namespace
+        self.chats: dict[tuple[int, int], Chat] = dict()
 
     async def add_chat(self, chat: Chat):
         """Adds a chat to the storage."""
@@ -143,6 +256,84 @@ class DictDialogStorage(DialogStorage):
         """Checks wheather the chat exists in the storage."""
         return (user_id, chat_id) in self.chats
 
+    def dump(self, file_path: str) -> int:
+        """Saves all chats to a JSON snapshot file.
+
+        Chats are saved as plain data, so a snapshot stays readable after
+        the chat classes change and loading it never executes code. The
+        snapshot is written to a temporary file first and then moved in
+        place, so a crash during saving never corrupts the previous one.
+
+        Args:
+            file_path: The snapshot file path.
+
+        Returns:
+            The number of saved chats.
+        """
+        snapshot = {
+            "version": SNAPSHOT_VERSION,
+            "chats": [
+                (
+                    chat.user_id,
+                    chat.chat_id,
+                    [
+                        message.model_dump(mode="json")
+                        for message in chat.messages
+                    ],
+                )
+                for chat in self.chats.values()
+            ],
+        }
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        temp_path = f"{file_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(snapshot, file, ensure_ascii=False)
+        os.replace(temp_path, file_path)
+        return len(snapshot["chats"])
+
+    def load(self, file_path: str) -> int:
+        """Restores chats from a snapshot file made by `dump`.
+
+        Chats that fail validation are skipped. Restored chats don't
+        override chats already in the storage.
+
+        Args:
+            file_path: The snapshot file path.
+
+        Returns:
+            The number of restored chats (0 if the snapshot doesn't exist).
+        """
+        if not os.path.exists(file_path):
+            return 0
+        try:
+            with open(file_path, encoding="utf-8") as file:
+                snapshot = json.load(file)
+        except Exception:
+            logger.exception("Can't read chats snapshot %s.", file_path)
+            return 0
+        if not isinstance(snapshot, dict) or (
+            snapshot.get("version") != SNAPSHOT_VERSION
+        ):
+            logger.warning(
+                "Chats snapshot %s has unsupported format, skipped.", file_path
+            )
+            return 0
+
+        restored = 0
+        for user_id, chat_id, messages in snapshot["chats"]:
+            try:
+                chat = Chat(
+                    user_id=user_id, chat_id=chat_id, messages=messages
+                )
+            except ValidationError as e:
+                logger.warning(
+                    "Can't restore chat %s: %s", (user_id, chat_id), e
+                )
+                continue
+            self.chats.setdefault((chat.user_id, chat.chat_id), chat)
+            restored += 1
+        return restored
+
 
 class DialogManager:
     """Manages `Chat` and `DialogStorage` together."""
@@ -164,12 +355,24 @@ class TelegramDialogManager(DialogManager):
 
     dialog_storage: DictDialogStorage
 
+    def __init__(
+            self,
+            dialog_storage: DictDialogStorage,
+            config_name: str = configs.tg_bot.model_name,
+    ):
+        super().__init__(dialog_storage)
+        self.config_name: str = config_name
+
     async def get_or_create_chat(self, user_id: int, chat_id: int) -> Chat:
         """Gets a chat from the manager's storage (creates if don't exists)."""
         if self.dialog_storage.is_chat_exists(user_id, chat_id):
             chat = await super().get_chat(user_id, chat_id)
         else:
-            chat = Chat(user_id=user_id, chat_id=chat_id)
+            chat = Chat(
+                user_id=user_id,
+                chat_id=chat_id,
+                config_name=self.config_name,
+            )
             await self.add_chat(chat)
         return chat
 
@@ -187,16 +390,21 @@ class TelegramDialogManager(DialogManager):
             message.from_user.id, message.chat.id
         )
 
-        if chat_model.is_voice_mode:
+        if chat.chat_model.is_voice_mode:
             response = await chat.get_audio_answer(message_text)
             voice_file = BufferedInputFile(
                 response, filename=f"{uuid.uuid4}.mp3"
             )
-            await message.answer_voice(voice_file)
+            with recorder.stage("send"):
+                await message.answer_voice(voice_file)
+        elif chat.chat_model.chatbot.stream:
+            answer_parts = chat.get_answer_stream(message_text)
+            with recorder.stage("stream_and_send"):
+                await send_chunks(message, split_stream(answer_parts))
         else:
             answer = await chat.get_answer(message_text)
-            answer = answer[:MAX_TELEGRAM_MESSAGE_LEN]
-            await message.reply(text=answer)
+            with recorder.stage("send"):
+                await send_chunks(message, split_text(answer))
 
     async def reply_on_voice(self, message: TgMessage, bot: Bot) -> None:
         """"Sends chat model's answer by given telegram voice message.
@@ -208,8 +416,13 @@ class TelegramDialogManager(DialogManager):
         Raises:
             EmptyTrancriptionResult: OpenAI transciption got empty result.
         """
-        voice_path = await save_voice_as_mp3(bot, message.voice)
-        if transcripted_voice_text := await speech_to_text(voice_path):
+        with recorder.stage("save_voice"):
+            voice_path = await save_voice_as_mp3(bot, message.voice)
+        cost = max(1, message.voice.duration / AUDIO_SECONDS_PER_COST_UNIT)
+        async with scheduler.slot(message.from_user.id, Lane.AUDIO, cost):
+            with recorder.stage("speech_to_text"):
+                transcripted_voice_text = await speech_to_text(voice_path)
+        if transcripted_voice_text:
             await self.reply_on_text(message, text=transcripted_voice_text)
         else:
             raise EmptyTrancriptionResult
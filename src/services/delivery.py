@@ -0,0 +1,223 @@
+"""A module provides delivery of long answers as several telegram messages.
+
+Answers are split on paragraph, line, sentence and word boundaries. Since
+messages are sent in the HTML parse mode, tags and entities are never cut,
+and tags left open in a chunk are closed and reopened in the next one.
+"""
+import asyncio
+import logging
+import re
+from typing import AsyncIterable, AsyncIterator, Iterable
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import Message
+
+from src.config.config import MAX_TELEGRAM_MESSAGE_LEN
+
+
+MAX_SEND_ATTEMPTS: int = 5
+SEPARATORS: tuple[str, ...] = ("\n\n", "\n", ". ", "! ", "? ", "; ", " ")
+"""Split boundaries ordered by preference."""
+
+STREAM_MIN_CHUNK_LEN: int = 500
+"""Min length of a streamed chunk sent at a paragraph boundary."""
+
+TELEGRAM_TAGS: tuple[str, ...] = (
+    "b", "strong", "i", "em", "u", "ins", "s", "strike", "del", "span",
+    "tg-spoiler", "a", "code", "pre", "blockquote",
+)
+"""Tags supported by the telegram HTML parse mode, others are plain text."""
+
+_TAG_NAMES = "|".join(re.escape(tag) for tag in TELEGRAM_TAGS)
+_TAG_RE = re.compile(rf"<(/?)({_TAG_NAMES})(?=[\s>])[^<>]*>", re.IGNORECASE)
+_TAG_START_RE = re.compile(rf"</?(?:{_TAG_NAMES})(?=[\s>]|$)", re.IGNORECASE)
+_ENTITY_RE = re.compile(r"&#?\w*$")
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+def _find_cut(text: str, limit: int) -> int:
+    """Returns the best position to cut the text not further than `limit`."""
+    cut = limit
+    for separator in SEPARATORS:
+        index = text.rfind(separator, 0, limit - len(separator) + 1)
+        # Don't make chunks too short for the sake of a nicer boundary.
+        if index >= limit // 2:
+            cut = index + len(separator)
+            break
+
+    # Don't cut inside of a tag or an entity, unless it's unreasonably long.
+    min_cut = limit // 2
+    tag_start = text.rfind("<", 0, cut)
+    if (
+        min_cut <= tag_start
+        and tag_start > text.rfind(">", 0, cut)
+        and _TAG_START_RE.match(text, tag_start, cut)
+    ):
+        cut = tag_start
+    entity = _ENTITY_RE.search(text, max(0, cut - 10), cut)
+    if entity and entity.start() >= min_cut:
+        cut = entity.start()
+    return max(cut, 1)
+
+
+def _update_open_tags(open_tags: list[tuple[str, str]], text: str) -> None:
+    """Tracks tags left open after the text as (name, opening tag) pairs."""
+    for match in _TAG_RE.finditer(text):
+        is_closing, name = match.group(1), match.group(2).lower()
+        if not is_closing:
+            open_tags.append((name, match.group(0)))
+            continue
+        for i in range(len(open_tags) - 1, -1, -1):
+            if open_tags[i][0] == name:
+                del open_tags[i]
+                break
+
+
+def _cut_chunks(text: str, max_len: int) -> tuple[list[str], str]:
+    """Cuts chunks off the text while it doesn't fit into one message.
+
+    Every chunk takes at least a quarter of `max_len` of the text: if
+    reopened and closing tags would take more room, the markup isn't
+    carried over to the next chunk anymore.
+
+    Returns:
+        Cut chunks and the rest of the text (with reopened tags) as is.
+    """
+    chunks: list[str] = []
+    open_tags: list[tuple[str, str]] = []
+    rest = text.lstrip()
+
+    while True:
+        prefix = "".join(tag for _, tag in open_tags)
+        if len(prefix) > max_len // 4:
+            open_tags, prefix = [], ""
+        if len(prefix) + len(rest) <= max_len:
+            return chunks, prefix + rest if rest else ""
+
+        limit = max_len - len(prefix)
+        while True:
+            cut = _find_cut(rest, limit)
+            chunk_tags = open_tags.copy()
+            _update_open_tags(chunk_tags, rest[:cut])
+            suffix = "".join(f"</{name}>" for name, _ in reversed(chunk_tags))
+            if len(prefix) + cut + len(suffix) <= max_len:
+                break
+            limit = max_len - len(prefix) - len(suffix)
+            if limit < max_len // 2:
+                # Too much markup to carry over, cut the text as is.
+                chunk_tags, suffix = [], ""
+                cut = _find_cut(rest, max_len - len(prefix))
+                break
+
+        if chunk := rest[:cut].rstrip():
+            chunks.append(prefix + chunk + suffix)
+        open_tags = chunk_tags
+        rest = rest[cut:].lstrip()
+
+
+def split_text(
+        text: str, max_len: int = MAX_TELEGRAM_MESSAGE_LEN
+) -> list[str]:
+    """Splits the text into chunks fitting into a telegram message.
+
+    Args:
+        text: Text to split, may contain HTML markup.
+        max_len: Max chunk length.
+
+    Returns:
+        Non-empty chunks in the text order.
+    """
+    chunks, rest = _cut_chunks(text, max_len)
+    if rest := rest.rstrip():
+        chunks.append(rest)
+    return chunks
+
+
+async def split_stream(
+        deltas: AsyncIterable[str], max_len: int = MAX_TELEGRAM_MESSAGE_LEN
+) -> AsyncIterator[str]:
+    """Splits streamed text into chunks as soon as they're ready to send.
+
+    A chunk is ready when the text doesn't fit into one message anymore
+    or, once it's longer than `STREAM_MIN_CHUNK_LEN`, at the end of
+    a paragraph without open tags.
+
+    Args:
+        deltas: Text parts in the stream order.
+        max_len: Max chunk length.
+
+    Yields:
+        Non-empty chunks in the text order.
+    """
+    buffer = ""
+    async for delta in deltas:
+        buffer += delta
+        if len(buffer) > max_len:
+            chunks, buffer = _cut_chunks(buffer, max_len)
+            for chunk in chunks:
+                yield chunk
+        elif (
+            len(buffer) > STREAM_MIN_CHUNK_LEN
+            and (end := buffer.rfind("\n\n", STREAM_MIN_CHUNK_LEN)) != -1
+        ):
+            open_tags: list[tuple[str, str]] = []
+            _update_open_tags(open_tags, buffer[:end])
+            if not open_tags and (chunk := buffer[:end].strip()):
+                yield chunk
+                buffer = buffer[end:].lstrip()
+    for chunk in split_text(buffer, max_len):
+        yield chunk
+
+
+async def _send(message: Message, text: str, is_reply: bool) -> None:
+    """Sends the text waiting out the telegram flood control."""
+    for attempt in range(1, MAX_SEND_ATTEMPTS + 1):
+        try:
+            if is_reply:
+                await message.reply(text=text)
+            else:
+                await message.answer(text=text)
+            return
+        except TelegramRetryAfter as e:
+            if attempt == MAX_SEND_ATTEMPTS:
+                raise
+            logger.warning("Flood control, retry in %ds.", e.retry_after)
+            await asyncio.sleep(e.retry_after)
+
+
+async def send_chunks(
+        message: Message, chunks: Iterable[str] | AsyncIterable[str]
+) -> None:
+    """Sends chunks in order as a reply to the message.
+
+    Chunks are produced in background while previous ones are being sent,
+    so a streamed answer is delivered while it's still being generated.
+
+    Args:
+        message: A telegram message to reply to.
+        chunks: Chunks to send, e.g. from `split_text` or `split_stream`.
+    """
+    if not isinstance(chunks, AsyncIterable):
+        for i, chunk in enumerate(chunks):
+            await _send(message, chunk, is_reply=i == 0)
+        return
+
+    queue: asyncio.Queue[str | None] = asyncio.Queue()
+
+    async def produce() -> None:
+        try:
+            async for chunk in chunks:
+                queue.put_nowait(chunk)
+        finally:
+            queue.put_nowait(None)
+
+    producer = asyncio.create_task(produce())
+    try:
+        is_reply = True
+        while (chunk := await queue.get()) is not None:
+            await _send(message, chunk, is_reply)
+            is_reply = False
+        await producer
+    finally:
+        producer.cancel()
@@ -6,6 +6,7 @@ class SystemMessage(str, enum.Enum):
     NO_BOTHER = "no_bother"
     NO_INPUT = "no_input"
     UNINTELLIGIBLE_VOICE_INPUT = "unintelligible_voice_input"
+    TOO_MANY_REQUESTS = "too_many_requests"
 
 
 MESSAGES: dict[SystemMessage, list[str]] = {
@@ -36,6 +37,14 @@ MESSAGES: dict[SystemMessage, list[str]] = {
         "Sorry, I couldn't catch that. Could you speak more clearly "
         "and try sending your message again?",
     ],
+    SystemMessage.TOO_MANY_REQUESTS: [
+        "I'm still working on your previous messages. "
+        "Please wait for my answer before sending more.",
+        "Hold on, I haven't answered your previous messages yet. "
+        "Please try again in a moment.",
+        "You're sending messages faster than I can answer. "
+        "Please wait a bit and try again.",
+    ],
 }
 
 
@@ -1,7 +1,7 @@
 """A module provides a function to complete a prompt with OpenAI's model."""
 import os
 import logging
-from typing import Iterable
+from typing import AsyncIterator, Iterable
 
 from openai import AsyncOpenAI
 from openai.types.chat import ChatCompletionMessageParam
@@ -38,6 +38,33 @@ async def complete(
     return message.strip()
 
 
+async def complete_stream(
+    messages: Iterable[ChatCompletionMessageParam], chat_model: ChatModel
+) -> AsyncIterator[str]:
+    """Completes the given prompt streaming the generated text.
+
+    Args:
+        messages: A list of messages comprising the conversation so far.
+        chat_model: Chat model to use for the completion.
+
+    Yields:
+        str: Parts of the completed text in the generation order.
+    """
+    try:
+        stream = await client.chat.completions.create(
+            messages=messages, stream=True,
+            **chat_model.get_openai_chat_params(),
+        )
+    except Exception as e:
+        logger.exception(
+            "Error while completion: %s. Messages: %s", e, messages
+        )
+        raise
+    async for chunk in stream:
+        if chunk.choices and (delta := chunk.choices[0].delta.content):
+            yield delta
+
+
 async def text_to_speech(text: str, chat_model: ChatModel) -> bytes:
     """Gets text to translate and a chat model to use, returns audio bytes.
 
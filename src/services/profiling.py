@@ -0,0 +1,238 @@
+"""A module provides opt-in profiling of requests handling.
+
+`FlightRecorder` keeps timelines of stages (tokenization, OpenAI requests,
+audio conversion, etc.) of the last requests. `LoopWatchdog` samples
+the stack of the event loop thread while the loop is blocked. Both can be
+dumped in the collapsed stacks format (as `py-spy record --format raw`),
+which is supported by speedscope and flamegraph.pl. Requests dumps hold
+stage paths, e.g. `process_text_message;add_message;count_tokens`, not
+Python frames; only the loop blocking dumps hold real stacks.
+
+When profiling is disabled, `recorder.request` and `recorder.stage` return
+a shared no-op context manager, so the instrumentation costs next to nothing.
+"""
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import ContextManager, Iterator
+
+from src.config import configs
+from src.config.config import Profiling
+
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+_NULL_CONTEXT: ContextManager[None] = contextlib.nullcontext()
+
+
+@dataclass
+class RequestTimeline:
+    """Stages timeline of one handled request.
+
+    Attributes:
+        name: Request name, e.g. a handler name.
+        user_id: Telegram user ID.
+        started_at: Unix time of the request start.
+        duration: Request duration in seconds.
+        stages: Stage paths with their start offsets and durations
+            in seconds.
+        perf_start: `time.perf_counter` value of the request start.
+    """
+    name: str
+    user_id: int
+    started_at: float = field(default_factory=time.time)
+    perf_start: float = field(default_factory=time.perf_counter, repr=False)
+    duration: float = 0.0
+    stages: list[tuple[tuple[str, ...], float, float]] = field(
+        default_factory=list
+    )
+
+    def to_collapsed_stacks(self) -> Iterator[str]:
+        """Yields the timeline in the collapsed stacks format.
+
+        Each line is a stage path and its self time in milliseconds.
+        """
+        self_times: Counter[tuple[str, ...]] = Counter()
+        self_times[()] += self.duration
+        for path, _, duration in self.stages:
+            self_times[path] += duration
+            self_times[path[:-1]] -= duration
+        for path, self_time in self_times.items():
+            if (ms := round(self_time * 1000)) > 0:
+                yield f"{';'.join((self.name, *path))} {ms}"
+
+
+class FlightRecorder:
+    """Keeps a ring buffer of the last requests stages timelines.
+
+    Usage:
+        with recorder.request("reply", user_id):
+            with recorder.stage("complete"):
+                ...
+
+    """
+
+    def __init__(self, config: Profiling):
+        self.config: Profiling = config
+        self.timelines: deque[RequestTimeline] = deque(
+            maxlen=config.buffer_size
+        )
+        self._timeline: ContextVar[RequestTimeline | None] = ContextVar(
+            "timeline", default=None
+        )
+        self._path: ContextVar[tuple[str, ...]] = ContextVar(
+            "path", default=()
+        )
+
+    def request(self, name: str, user_id: int) -> ContextManager[None]:
+        """Records a timeline of the request handled inside the context."""
+        if not self.config.enabled:
+            return _NULL_CONTEXT
+        return self._record_request(name, user_id)
+
+    def stage(self, name: str) -> ContextManager[None]:
+        """Records a stage of the current request timeline."""
+        if not self.config.enabled or self._timeline.get() is None:
+            return _NULL_CONTEXT
+        return self._record_stage(name)
+
+    @contextlib.contextmanager
+    def _record_request(self, name: str, user_id: int) -> Iterator[None]:
+        timeline = RequestTimeline(name=name, user_id=user_id)
+        timeline_token = self._timeline.set(timeline)
+        path_token = self._path.set(())
+        try:
+            yield
+        finally:
+            timeline.duration = time.perf_counter() - timeline.perf_start
+            self._path.reset(path_token)
+            self._timeline.reset(timeline_token)
+            self.timelines.append(timeline)
+
+    @contextlib.contextmanager
+    def _record_stage(self, name: str) -> Iterator[None]:
+        timeline = self._timeline.get()
+        path = (*self._path.get(), name)
+        path_token = self._path.set(path)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self._path.reset(path_token)
+            offset = start - timeline.perf_start
+            timeline.stages.append((path, offset, duration))
+
+    def slowest(self, num: int) -> list[RequestTimeline]:
+        """Returns the slowest recorded requests timelines."""
+        return sorted(
+            self.timelines, key=lambda timeline: timeline.duration,
+            reverse=True,
+        )[:num]
+
+
+class LoopWatchdog:
+    """Reports the event loop being blocked longer than a threshold.
+
+    A heartbeat coroutine updates a timestamp on every loop iteration and
+    a background thread checks it. While the heartbeat is late, the thread
+    samples the stack of the loop thread, so the blocking call is seen in
+    logs and in the collapsed stacks dump.
+    """
+
+    def __init__(self, config: Profiling):
+        self.config: Profiling = config
+        self.stacks: Counter[str] = Counter()
+        self._heartbeat: float = time.monotonic()
+        self._loop_thread_id: int | None = None
+        self._stopped = threading.Event()
+        self._heartbeat_task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        """Starts watching the running event loop."""
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat_task = asyncio.create_task(self._beat())
+        threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        ).start()
+
+    def stop(self) -> None:
+        """Stops watching the event loop."""
+        self._stopped.set()
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+
+    async def _beat(self) -> None:
+        interval = self.config.block_threshold / 2
+        while True:
+            self._heartbeat = time.monotonic()
+            await asyncio.sleep(interval)
+
+    def _watch(self) -> None:
+        interval = self.config.block_threshold / 2
+        reported_heartbeat = None
+        while not self._stopped.wait(interval):
+            # The heartbeat is expected once per interval.
+            blocked_for = time.monotonic() - self._heartbeat - interval
+            if blocked_for < self.config.block_threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            self.stacks[";".join(
+                f"{entry.name} ({os.path.basename(entry.filename)}"
+                f":{entry.lineno})"
+                for entry in stack
+            )] += 1
+            if reported_heartbeat != self._heartbeat:
+                reported_heartbeat = self._heartbeat
+                logger.warning(
+                    "Event loop is blocked for %.3fs:\n%s",
+                    blocked_for, "".join(traceback.format_list(stack)),
+                )
+
+
+recorder = FlightRecorder(configs.profiling)
+watchdog = LoopWatchdog(configs.profiling)
+
+
+def dump_profiles() -> str:
+    """Dumps the slowest requests and loop blocking stacks to files.
+
+    Timelines of the slowest requests are saved as JSON and in the collapsed
+    stacks format, the loop blocking stacks in the collapsed stacks format.
+
+    Returns:
+        The directory with the dumped files.
+    """
+    directory = configs.profiling.dump_directory
+    os.makedirs(directory, exist_ok=True)
+    path_prefix = os.path.join(directory, time.strftime("%Y%m%d-%H%M%S"))
+
+    slowest = recorder.slowest(configs.profiling.slowest_num)
+    with open(f"{path_prefix}-requests.json", "w") as file:
+        json.dump([asdict(timeline) for timeline in slowest], file, indent=2)
+    with open(f"{path_prefix}-requests.txt", "w") as file:
+        for timeline in slowest:
+            for line in timeline.to_collapsed_stacks():
+                file.write(f"{line}\n")
+
+    with open(f"{path_prefix}-blocking.txt", "w") as file:
+        for stack, samples in watchdog.stacks.items():
+            file.write(f"{stack} {samples}\n")
+
+    logger.info(
+        "Dumped %d slowest requests and %d blocking stacks to %s.",
+        len(slowest), len(watchdog.stacks), directory,
+    )
+    return directory
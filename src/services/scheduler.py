@@ -0,0 +1,214 @@
+"""A module provides a fair scheduler of requests to OpenAI.
+
+Requests are served with fair queuing across users weighted by requests
+cost, so a user sending many heavy requests can't starve other users. Text
+and audio requests are served in separate lanes with their own concurrency.
+The number of messages being answered to one user at once is limited.
+"""
+import asyncio
+import enum
+import heapq
+import itertools
+import logging
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Iterator
+
+from src.config import configs
+from src.config.config import SchedulerLimits
+from src.errors.errors import TooManyRequests
+from src.services.profiling import recorder
+
+
+AUDIO_SECONDS_PER_COST_UNIT: int = 10
+"""Voice duration in seconds which costs as one text request."""
+
+WAIT_SAMPLES_NUM: int = 1000
+"""Number of last queue wait times kept per lane for statistics."""
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class Lane(str, enum.Enum):
+    TEXT = "text"
+    AUDIO = "audio"
+
+
+@dataclass(order=True)
+class _Job:
+    finish_tag: float
+    seq: int
+    start_tag: float = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    enqueued_at: float = field(compare=False)
+
+
+class _LaneQueue:
+    """Queue of one lane ordered by virtual finish time of jobs."""
+
+    def __init__(self, concurrency: int):
+        self.concurrency: int = concurrency
+        self.running: int = 0
+        self.virtual_time: float = 0.0
+        self.finish_tags: dict[int, float] = {}
+        self.jobs: list[_Job] = []
+        self.waits: deque[float] = deque(maxlen=WAIT_SAMPLES_NUM)
+
+
+class FairScheduler:
+    """Schedules requests to OpenAI fairly across users.
+
+    Usage:
+        with scheduler.admit(user_id):
+            ...
+            async with scheduler.slot(user_id, Lane.TEXT):
+                await complete(...)
+
+    """
+
+    def __init__(self, limits: SchedulerLimits):
+        self.limits: SchedulerLimits = limits
+        self._lanes: dict[Lane, _LaneQueue] = {
+            Lane.TEXT: _LaneQueue(limits.text_concurrency),
+            Lane.AUDIO: _LaneQueue(limits.audio_concurrency),
+        }
+        self._outstanding: defaultdict[int, int] = defaultdict(int)
+        self._seq = itertools.count()
+        self._stats_logging: asyncio.Task | None = None
+
+    @contextmanager
+    def admit(self, user_id: int) -> Iterator[None]:
+        """Admits a user message to be answered.
+
+        Must wrap the whole answer, so a message is either rejected before
+        any work is done or answered completely.
+
+        Args:
+            user_id: Telegram user ID.
+
+        Raises:
+            TooManyRequests: The user has too many messages being answered.
+        """
+        if self._outstanding[user_id] >= self.limits.max_user_requests:
+            raise TooManyRequests(
+                f"User {user_id} has too many outstanding requests."
+            )
+        self._outstanding[user_id] += 1
+        try:
+            yield
+        finally:
+            self._outstanding[user_id] -= 1
+            if not self._outstanding[user_id]:
+                del self._outstanding[user_id]
+                for queue in self._lanes.values():
+                    queue.finish_tags.pop(user_id, None)
+
+    @asynccontextmanager
+    async def slot(
+            self, user_id: int, lane: Lane, cost: float = 1.0
+    ) -> AsyncIterator[None]:
+        """Waits for the user's turn in the lane and holds a request slot.
+
+        Args:
+            user_id: Telegram user ID.
+            lane: Lane of the request.
+            cost: Relative cost of the request, a text request costs 1.
+        """
+        queue = self._lanes[lane]
+        with recorder.stage("queue_wait"):
+            await self._acquire(queue, user_id, cost)
+        try:
+            yield
+        finally:
+            self._release(queue)
+
+    async def _acquire(
+            self, queue: _LaneQueue, user_id: int, cost: float
+    ) -> None:
+        """Enqueues a job and waits until it gets a slot."""
+        start_tag = max(
+            queue.virtual_time, queue.finish_tags.get(user_id, 0.0)
+        )
+        finish_tag = start_tag + cost
+        queue.finish_tags[user_id] = finish_tag
+
+        if queue.running < queue.concurrency and not queue.jobs:
+            queue.running += 1
+            queue.virtual_time = max(queue.virtual_time, start_tag)
+            queue.waits.append(0.0)
+            return
+
+        job = _Job(
+            finish_tag=finish_tag,
+            seq=next(self._seq),
+            start_tag=start_tag,
+            future=asyncio.get_running_loop().create_future(),
+            enqueued_at=time.monotonic(),
+        )
+        heapq.heappush(queue.jobs, job)
+        try:
+            await job.future
+        except asyncio.CancelledError:
+            if job.future.done() and not job.future.cancelled():
+                # The slot was granted right before the cancellation.
+                self._release(queue)
+            elif job in queue.jobs:
+                queue.jobs.remove(job)
+                heapq.heapify(queue.jobs)
+            raise
+
+    def _release(self, queue: _LaneQueue) -> None:
+        """Frees a slot and passes it to the job with the least finish tag."""
+        queue.running -= 1
+        while queue.jobs:
+            job = heapq.heappop(queue.jobs)
+            # Skip jobs cancelled but not removed from the queue yet.
+            if job.future.done():
+                continue
+            queue.running += 1
+            queue.virtual_time = max(queue.virtual_time, job.start_tag)
+            wait = time.monotonic() - job.enqueued_at
+            queue.waits.append(wait)
+            logger.debug("Job waited %.3fs in the queue.", wait)
+            job.future.set_result(None)
+            return
+
+    def wait_percentile(self, lane: Lane, percentile: float) -> float:
+        """Returns a percentile of the last queue wait times in seconds."""
+        waits = sorted(self._lanes[lane].waits)
+        if not waits:
+            return 0.0
+        index = min(len(waits) - 1, int(len(waits) * percentile / 100))
+        return waits[index]
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """Returns the lanes load and queue wait time statistics."""
+        return {
+            lane.value: {
+                "running": queue.running,
+                "queued": len(queue.jobs),
+                "wait_p50": self.wait_percentile(lane, 50),
+                "wait_p99": self.wait_percentile(lane, 99),
+            }
+            for lane, queue in self._lanes.items()
+        }
+
+    def start_logging_stats(self, interval: float) -> None:
+        """Starts logging the statistics every `interval` seconds."""
+        self._stats_logging = asyncio.create_task(self._log_stats(interval))
+
+    async def _log_stats(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            for lane, stats in self.stats().items():
+                logger.info(
+                    "Lane %s: %d running, %d queued, "
+                    "wait p50 %.3fs, p99 %.3fs.",
+                    lane, stats["running"], stats["queued"],
+                    stats["wait_p50"], stats["wait_p99"],
+                )
+
+
+scheduler = FairScheduler(configs.scheduler)
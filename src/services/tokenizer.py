@@ -0,0 +1,123 @@
+"""A module provides token counting off the event loop.
+
+Texts to count from all chats are collected into batches and encoded with
+tiktoken's batch encoder in dedicated threads. Long texts are batched
+separately from short ones, so a long pasted text never delays token
+counting for users sending short messages.
+"""
+import asyncio
+import enum
+import functools
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import tiktoken
+
+
+MAX_BATCH_SIZE: int = 256
+LONG_TEXT_LEN: int = 1000
+"""Min length in characters of a text to count in the long texts lane."""
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+@functools.cache
+def get_encoder(model: str) -> tiktoken.Encoding:
+    """Returns a tokenizer of the model shared by all chats."""
+    return tiktoken.encoding_for_model(model)
+
+
+class _Lane(enum.Enum):
+    SHORT = "short"
+    LONG = "long"
+
+
+_Job = tuple[str, str, asyncio.Future]
+"""Model, text to count tokens in and a future for the result."""
+
+
+class TokenCounter:
+    """Counts tokens in batches in background threads.
+
+    While a batch is being encoded, new texts are queued and go together
+    into the next batch, so batches grow with the load.
+
+    Usage:
+        tokens_num = await token_counter.count(text, model)
+
+    """
+
+    def __init__(self):
+        self._executors: dict[_Lane, ThreadPoolExecutor] = {
+            lane: ThreadPoolExecutor(1, f"tokenizer-{lane.value}")
+            for lane in _Lane
+        }
+        self._pending: dict[_Lane, list[_Job]] = {lane: [] for lane in _Lane}
+        self._running: set[_Lane] = set()
+
+    async def count(self, text: str, model: str) -> int:
+        """Returns the number of tokens in the text.
+
+        Args:
+            text: Text to count tokens in.
+            model: OpenAI model ID which tokenizer to use.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        lane = _Lane.LONG if len(text) >= LONG_TEXT_LEN else _Lane.SHORT
+        self._pending[lane].append((model, text, future))
+        if lane not in self._running:
+            self._running.add(lane)
+            # Let other chats add their texts in this loop iteration.
+            loop.call_soon(self._flush, lane)
+        return await future
+
+    def _flush(self, lane: _Lane) -> None:
+        """Sends the pending texts of the lane to encode as a batch."""
+        batch = self._pending[lane][:MAX_BATCH_SIZE]
+        del self._pending[lane][:MAX_BATCH_SIZE]
+        if not batch:
+            self._running.discard(lane)
+            return
+
+        encoding = asyncio.get_running_loop().run_in_executor(
+            self._executors[lane], self._encode, batch
+        )
+        encoding.add_done_callback(
+            functools.partial(self._on_encoded, lane, batch)
+        )
+
+    def _on_encoded(
+            self, lane: _Lane, batch: list[_Job], encoding: asyncio.Future
+    ) -> None:
+        """Passes results of the batch and starts the next one."""
+        if encoding.exception():
+            logger.error("Token counting failed: %s", encoding.exception())
+        for i, (_, _, future) in enumerate(batch):
+            if future.done():
+                continue
+            if encoding.exception():
+                future.set_exception(encoding.exception())
+            else:
+                future.set_result(encoding.result()[i])
+        self._flush(lane)
+
+    @staticmethod
+    def _encode(batch: list[_Job]) -> list[int]:
+        """Encodes the batch texts grouped by model, returns tokens nums."""
+        indexes_by_model: defaultdict[str, list[int]] = defaultdict(list)
+        for i, (model, _, _) in enumerate(batch):
+            indexes_by_model[model].append(i)
+
+        tokens_nums = [0] * len(batch)
+        for model, indexes in indexes_by_model.items():
+            encoded_texts = get_encoder(model).encode_batch(
+                [batch[i][1] for i in indexes], disallowed_special=()
+            )
+            for i, tokens in zip(indexes, encoded_texts):
+                tokens_nums[i] = len(tokens)
+        return tokens_nums
+
+
+token_counter = TokenCounter()
@@ -0,0 +1,9 @@
+import os
+
+
+# `src.config` loads the configuration on import, so it must be set first.
+os.environ.setdefault("BOT_TOKEN", "123456:TEST")
+os.environ.setdefault("OPENAI_TOKEN", "test")
+os.environ.setdefault("MODEL_CONFIG_PATH", "models.yml")
+os.environ.setdefault("MODEL_CONFIG_NAME", "default")
+os.environ.setdefault("DEBUG", "0")
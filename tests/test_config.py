@@ -0,0 +1,16 @@
+import pytest
+
+from src.config.helpers import parse_bot_tokens
+
+
+def test_parse_bot_tokens():
+    assert parse_bot_tokens("default=1:AAA, pirate = 2:BBB") == [
+        ("default", "1:AAA"), ("pirate", "2:BBB")
+    ]
+
+
+def test_parse_bot_tokens_rejects_bad_values():
+    with pytest.raises(ValueError):
+        parse_bot_tokens("default=1:AAA,pirate=1:AAA")
+    with pytest.raises(ValueError):
+        parse_bot_tokens("default=1:AAA,pirate")
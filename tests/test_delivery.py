@@ -0,0 +1,130 @@
+import asyncio
+import re
+import time
+
+from src.services.delivery import split_stream, split_text
+
+
+def _plain(text: str) -> str:
+    """Returns the text without telegram tags and whitespaces."""
+    text = re.sub(r"</?(b|i|code|pre|a)( [^>]*)?>", "", text)
+    return re.sub(r"\s+", "", text)
+
+
+def _collect(deltas: list[str], max_len: int) -> list[str]:
+    async def stream():
+        for delta in deltas:
+            yield delta
+
+    async def collect():
+        return [chunk async for chunk in split_stream(stream(), max_len)]
+
+    return asyncio.run(collect())
+
+
+def test_short_text_is_one_chunk():
+    assert split_text("  Hello, world!\n") == ["Hello, world!"]
+
+
+def test_splits_on_paragraphs_then_sentences():
+    text = "First sentence. Second sentence.\n\nNext paragraph here."
+    assert split_text(text, 40) == [
+        "First sentence. Second sentence.", "Next paragraph here."
+    ]
+    assert split_text("One sentence. Another sentence.", 20) == [
+        "One sentence.", "Another sentence."
+    ]
+
+
+def test_chunks_keep_order_and_content():
+    text = " ".join(f"Sentence number {i}." for i in range(2000))
+    chunks = split_text(text, 300)
+    assert all(0 < len(chunk) <= 300 for chunk in chunks)
+    assert _plain("".join(chunks)) == _plain(text)
+    numbers = [int(n) for n in re.findall(r"\d+", " ".join(chunks))]
+    assert numbers == list(range(2000))
+
+
+def test_open_tags_are_closed_and_reopened():
+    text = "<b>" + "bold words " * 20 + "</b> tail"
+    chunks = split_text(text, 60)
+    assert len(chunks) > 1
+    for chunk in chunks[:-1]:
+        assert chunk.startswith("<b>") and chunk.endswith("</b>")
+    assert _plain("".join(chunks)) == _plain(text)
+
+
+def test_tags_and_entities_are_not_cut():
+    text = "word " * 30 + '<a href="https://example.com">link</a> &amp; end'
+    for max_len in range(70, 200):
+        for chunk in split_text(text, max_len):
+            assert chunk.count("<") == chunk.count(">")
+            assert not re.search(r"&\w*$", chunk)
+
+
+def test_unsupported_tags_are_plain_text():
+    line = "List<String> lN = new ArrayList<>();<br>\n"
+    text = line * 600
+    start = time.perf_counter()
+    chunks = split_text(text)
+    assert time.perf_counter() - start < 0.5
+    assert len(chunks) <= len(text) // 4095 + 2
+    assert sum(map(len, chunks)) <= len(text)
+    assert _plain("".join(chunks)) == _plain(text)
+
+
+def test_generic_types_throughput():
+    text = "Map<A, B> m = new HashMap<>(); " * 650
+    start = time.perf_counter()
+    chunks = split_text(text)
+    assert time.perf_counter() - start < 0.5
+    assert len(chunks) <= len(text) // 4095 + 2
+    assert _plain("".join(chunks)) == _plain(text)
+
+
+def test_deeply_nested_tags_make_progress():
+    text = "<b><i><code>" * 200 + "text " * 2000
+    chunks = split_text(text, 200)
+    assert all(0 < len(chunk) <= 200 for chunk in chunks)
+    assert len(chunks) <= len(text) // 50
+
+
+def test_long_text_throughput():
+    text = "<b>Bold</b> text. " * 50000
+    start = time.perf_counter()
+    chunks = split_text(text)
+    assert time.perf_counter() - start < 1
+    assert all(len(chunk) <= 4095 for chunk in chunks)
+    assert len(chunks) <= len(text) // 3000
+
+
+def test_stream_keeps_order_and_content():
+    text = " ".join(f"Word{i}" for i in range(3000))
+    deltas = [text[i:i + 7] for i in range(0, len(text), 7)]
+    chunks = _collect(deltas, 500)
+    assert all(0 < len(chunk) <= 500 for chunk in chunks)
+    assert _plain("".join(chunks)) == _plain(text)
+
+
+def test_stream_flushes_paragraphs_before_the_end():
+    paragraph = "A sentence of the paragraph. " * 30
+    produced: list[int] = []
+
+    async def stream():
+        for i in range(3):
+            produced.append(i)
+            yield paragraph + "\n\n"
+
+    async def first_chunk():
+        async for chunk in split_stream(stream()):
+            return chunk, len(produced)
+
+    chunk, produced_num = asyncio.run(first_chunk())
+    assert chunk == paragraph.strip()
+    assert produced_num < 3
+
+
+def test_stream_doesnt_flush_inside_tags():
+    deltas = ["<pre>", "code line\n\n" * 100, "</pre>"]
+    chunks = _collect(deltas, 4095)
+    assert chunks == [("<pre>" + "code line\n\n" * 100 + "</pre>").strip()]
@@ -0,0 +1,28 @@
+import asyncio
+
+from src.handlers.middlewares import InFlightMiddleware
+
+
+def test_drain_waits_for_handlers():
+    async def main():
+        in_flight = InFlightMiddleware()
+        handled: list[str] = []
+
+        async def handler(event, data):
+            await asyncio.sleep(event)
+            handled.append(event)
+
+        assert await in_flight.drain(timeout=1) == 0
+        updates = [
+            asyncio.create_task(in_flight(handler, delay, {}))
+            for delay in (0.01, 0.02, 5)
+        ]
+        await asyncio.sleep(0)
+        assert len(in_flight.tasks) == 3
+
+        assert await in_flight.drain(timeout=0.1) == 1
+        assert handled == [0.01, 0.02]
+        assert len(in_flight.tasks) == 1
+        updates[-1].cancel()
+
+    asyncio.run(main())
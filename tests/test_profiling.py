@@ -0,0 +1,44 @@
+import time
+
+from src.config.config import Profiling
+from src.services.profiling import (
+    _NULL_CONTEXT, FlightRecorder, RequestTimeline
+)
+
+
+def test_collapsed_stacks_have_self_times():
+    timeline = RequestTimeline(name="reply", user_id=1, duration=1.0)
+    timeline.stages = [
+        (("add_message", "count_tokens"), 0.0, 0.2),
+        (("add_message", "count_tokens"), 0.3, 0.1),
+        (("add_message",), 0.0, 0.6),
+        (("send", "retry"), 0.7, 0.2),
+        (("send",), 0.7, 0.2),
+    ]
+    assert sorted(timeline.to_collapsed_stacks()) == [
+        "reply 200",
+        "reply;add_message 300",
+        "reply;add_message;count_tokens 300",
+        "reply;send;retry 200",
+    ]
+
+
+def test_disabled_recorder_records_nothing():
+    recorder = FlightRecorder(Profiling(enabled=False))
+    assert recorder.request("reply", 1) is _NULL_CONTEXT
+    with recorder.request("reply", 1):
+        assert recorder.stage("complete") is _NULL_CONTEXT
+    assert not recorder.timelines
+
+
+def test_recorder_keeps_last_timelines():
+    recorder = FlightRecorder(Profiling(enabled=True, buffer_size=3))
+    for i in range(5):
+        with recorder.request(f"reply{i}", i):
+            with recorder.stage("complete"):
+                time.sleep(0.01 * (i % 3))
+    assert [t.name for t in recorder.timelines] == [
+        "reply2", "reply3", "reply4"
+    ]
+    assert [t.name for t in recorder.slowest(2)] == ["reply2", "reply4"]
+    assert recorder.timelines[0].stages[0][0] == ("complete",)
@@ -0,0 +1,92 @@
+import asyncio
+
+from src.config.config import SchedulerLimits
+from src.errors.errors import TooManyRequests
+from src.services.scheduler import FairScheduler, Lane
+
+
+def test_cancelled_waiter_doesnt_leak_slot():
+    async def main():
+        scheduler = FairScheduler(SchedulerLimits(text_concurrency=1))
+        holding = asyncio.Event()
+        release = asyncio.Event()
+
+        async def holder():
+            async with scheduler.slot(1, Lane.TEXT):
+                holding.set()
+                await release.wait()
+
+        async def waiter():
+            async with scheduler.slot(2, Lane.TEXT):
+                pass
+
+        holder_task = asyncio.create_task(holder())
+        await holding.wait()
+        waiter_task = asyncio.create_task(waiter())
+        await asyncio.sleep(0)
+
+        # The holder releases and the waiter is cancelled in the same tick.
+        release.set()
+        waiter_task.cancel()
+        await holder_task
+        assert waiter_task.cancelled() or await waiter_task is None
+
+        assert scheduler.stats()["text"]["running"] == 0
+        assert scheduler.stats()["text"]["queued"] == 0
+        await asyncio.wait_for(waiter(), timeout=1)
+
+    asyncio.run(main())
+
+
+def test_light_users_latency_under_noisy_neighbor():
+    async def main():
+        scheduler = FairScheduler(SchedulerLimits(text_concurrency=2))
+        latencies: dict[str, list[float]] = {"heavy": [], "light": []}
+        loop = asyncio.get_running_loop()
+
+        async def request(user_id: int, kind: str, duration: float):
+            start = loop.time()
+            async with scheduler.slot(user_id, Lane.TEXT):
+                await asyncio.sleep(duration)
+            latencies[kind].append(loop.time() - start)
+
+        async def light_user(user_id: int):
+            for _ in range(5):
+                await request(user_id, "light", 0.01)
+                await asyncio.sleep(0.01)
+
+        # The heavy user floods the lane with long requests at once.
+        tasks = [
+            asyncio.create_task(request(1, "heavy", 0.05))
+            for _ in range(60)
+        ]
+        await asyncio.sleep(0.01)
+        tasks += [
+            asyncio.create_task(light_user(user_id))
+            for user_id in range(100, 110)
+        ]
+        await asyncio.gather(*tasks)
+        return latencies
+
+    latencies = asyncio.run(main())
+    light = sorted(latencies["light"])
+    light_p99 = light[int(len(light) * 0.99) - 1]
+    # The heavy user's backlog takes 1.5s, light requests wait a few slots.
+    assert max(latencies["heavy"]) > 1
+    assert light_p99 < 0.3
+
+
+def test_admit_limits_messages_per_user():
+    scheduler = FairScheduler(SchedulerLimits(max_user_requests=1))
+    with scheduler.admit(1):
+        with scheduler.admit(2):
+            pass
+        try:
+            with scheduler.admit(1):
+                pass
+        except TooManyRequests:
+            pass
+        else:
+            raise AssertionError("The second message is admitted.")
+    with scheduler.admit(1):
+        pass
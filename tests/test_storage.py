@@ -0,0 +1,89 @@
+import asyncio
+import json
+import logging
+
+from src.models import DictDialogStorage
+from src.models.base import Message, Role
+from src.models.models import SNAPSHOT_VERSION, Chat
+from src.services import tokenizer
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "chats.json")
+    storage = DictDialogStorage()
+    chat = Chat(user_id=1, chat_id=2)
+    chat.messages.append(Message(content="Hello!", role=Role.USER))
+    storage.chats[(1, 2)] = chat
+    assert storage.dump(path) == 1
+
+    restored = DictDialogStorage()
+    assert restored.load(path) == 1
+    restored_chat = restored.chats[(1, 2)]
+    assert restored_chat.messages == chat.messages
+    assert restored_chat.messages[0].role == Role.SYSTEM
+
+
+def test_invalid_chats_are_skipped(tmp_path, caplog):
+    path = tmp_path / "chats.json"
+    messages = [{"content": "Hi", "role": "user"}]
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "chats": [
+            (1, 1, messages),
+            (2, 2, [{"content": "Hi", "role": "unknown"}]),
+        ],
+    }
+    path.write_text(json.dumps(snapshot))
+
+    storage = DictDialogStorage()
+    with caplog.at_level(logging.WARNING):
+        assert storage.load(str(path)) == 1
+    assert list(storage.chats) == [(1, 1)]
+    assert "Can't restore chat" in caplog.text
+
+
+def test_unknown_snapshot_format_is_skipped(tmp_path):
+    path = tmp_path / "chats.json"
+    path.write_text(json.dumps([[1, 1, "an old chat"]]))
+    assert DictDialogStorage().load(str(path)) == 0
+    path.write_bytes(b"\x80\x05not a json")
+    assert DictDialogStorage().load(str(path)) == 0
+
+
+def test_restored_chat_is_bound_to_bot_config():
+    chat = Chat(user_id=1, chat_id=1, messages=[
+        {"content": "An old description.", "role": "system"},
+        {"content": "Hi", "role": "user"},
+    ])
+    chat.bind_config(chat.config_name)
+    assert [m.content for m in chat.messages] == [
+        chat.chat_model.chatbot.description, "Hi"
+    ]
+
+
+class _WordsEncoder:
+    """Encodes texts to words, tiktoken needs the network to load encoders."""
+
+    def encode_batch(self, texts, **kwargs):
+        return [text.split() for text in texts]
+
+
+def test_restored_messages_are_counted_before_trimming(monkeypatch):
+    monkeypatch.setattr(
+        tokenizer, "get_encoder", lambda model: _WordsEncoder()
+    )
+    chat = Chat(user_id=1, chat_id=1, messages=[
+        {"content": "Description.", "role": "system"},
+        {"content": "Old message. " * 100, "role": "user"},
+    ])
+    assert len(chat) == 0
+
+    async def add_messages():
+        await asyncio.gather(*(
+            chat.add_message(f"Message {i}.") for i in range(10)
+        ))
+
+    asyncio.run(add_messages())
+    assert all(m._tokens_num is not None for m in chat.messages)
+    assert len(chat) == sum(m._tokens_num for m in chat.messages)
+    assert len(chat) < chat.max_context_window
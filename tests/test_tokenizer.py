@@ -0,0 +1,50 @@
+import asyncio
+import time
+
+from src.services import tokenizer
+from src.services.tokenizer import LONG_TEXT_LEN, TokenCounter
+
+
+class _SlowEncoder:
+    """Encodes texts to words taking time proportional to texts length."""
+
+    def encode_batch(self, texts, **kwargs):
+        time.sleep(sum(map(len, texts)) * 1e-6)
+        return [text.split() for text in texts]
+
+
+def test_short_texts_latency_with_long_texts(monkeypatch):
+    monkeypatch.setattr(
+        tokenizer, "get_encoder", lambda model: _SlowEncoder()
+    )
+    long_text = "word " * 20000  # ~0.1s to encode.
+    assert len(long_text) >= LONG_TEXT_LEN
+
+    async def main():
+        token_counter = TokenCounter()
+        loop = asyncio.get_running_loop()
+        latencies: list[float] = []
+        done = asyncio.Event()
+
+        async def long_user():
+            while not done.is_set():
+                assert await token_counter.count(long_text, "gpt") == 20000
+
+        async def short_user():
+            for i in range(50):
+                start = loop.time()
+                assert await token_counter.count(f"Hi {i}", "gpt") == 2
+                latencies.append(loop.time() - start)
+                await asyncio.sleep(0.01)
+
+        long_users = [asyncio.create_task(long_user()) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        await short_user()
+        done.set()
+        await asyncio.gather(*long_users)
+        return sorted(latencies)
+
+    latencies = asyncio.run(main())
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    # Short texts don't wait for long batches which take 0.1-0.3s.
+    assert p99 < 0.05